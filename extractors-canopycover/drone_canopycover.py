@@ -10,6 +10,8 @@ import random
 import time
 import csv
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import numpy as np
 
 from osgeo import ogr
@@ -38,6 +40,17 @@ if 'ua-mac' in STATIONS:
                                               'pattern': '{sensor}_L3_{station}_{date}{opts}.csv',
                                              }
 
+# Session used to look up datasets so that connections to the host are reused. Lookups that fail,
+# or that the host or a gateway reports as temporarily unavailable, are retried a few times
+DATASET_SESSION = requests.Session()
+DATASET_ADAPTER = HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.5,
+                                                status_forcelist=[502, 503, 504]))
+DATASET_SESSION.mount('http://', DATASET_ADAPTER)
+DATASET_SESSION.mount('https://', DATASET_ADAPTER)
+
+# Number of seconds to wait on the host when looking up a dataset
+DATASET_LOOKUP_TIMEOUT = 30
+
 # Number of tries to open a CSV file before we give up
 MAX_CSV_FILE_OPEN_TRIES = 10
 
@@ -388,13 +401,14 @@ class CanopyCover(TerrarefExtractor):
                 if ('parent' in resource) and ('id' in resource['parent']):
                     return resource['parent']['id']
 
-        # Look through all the datasets we can retrieve to find the ID
+        # Look up the dataset by its name
         if dataset_name:
-            url = '%s/api/datasets/sorted' % (host)
-            params = {"key" : key, "limit" : 50000}
+            url = '%s/api/datasets' % (host)
+            params = {"key" : key, "title" : dataset_name, "exact" : "true"}
             headers = {'content-type': 'application/json'}
 
-            response = requests.get(url, headers=headers, params=params, verify=False)
+            response = DATASET_SESSION.get(url, headers=headers, params=params, verify=False,
+                                           timeout=DATASET_LOOKUP_TIMEOUT)
             response.raise_for_status()
             datasets = response.json()
 
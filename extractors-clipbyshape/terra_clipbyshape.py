@@ -7,6 +7,8 @@ import os
 import logging
 import sys
 import requests # for dsid_by_name()
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import osr
 
 from osgeo import ogr
@@ -37,6 +39,17 @@ if 'ua-mac' in STATIONS:
                                                          '{sensor}/{date}/{timestamp}/{plot}/{filename}'
                                             }
 
+# Session used to look up datasets so that connections to the host are reused. Lookups that fail,
+# or that the host or a gateway reports as temporarily unavailable, are retried a few times
+DATASET_SESSION = requests.Session()
+DATASET_ADAPTER = HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.5,
+                                                status_forcelist=[502, 503, 504]))
+DATASET_SESSION.mount('http://', DATASET_ADAPTER)
+DATASET_SESSION.mount('https://', DATASET_ADAPTER)
+
+# Number of seconds to wait on the host when looking up a dataset
+DATASET_LOOKUP_TIMEOUT = 30
+
 def find_all_plot_names(plot_name, column_names):
     """Returns whether or not all the plot names are found in
        the list of column names.
@@ -101,10 +114,11 @@ def dsid_by_name(host, key, name):
         Returns the ID of the dataset if it's found. Returns None if the dataset
         isn't found
     """
-    url = "%sapi/datasets?key=%s&title=%s&exact=true" % (host, key, name)
+    url = "%sapi/datasets" % host
+    params = {"key": key, "title": name, "exact": "true"}
 
     try:
-        result = requests.get(url)
+        result = DATASET_SESSION.get(url, params=params, timeout=DATASET_LOOKUP_TIMEOUT)
         result.raise_for_status()
 
         ds_md = result.json()
@@ -112,7 +126,7 @@ def dsid_by_name(host, key, name):
     except Exception as ex:     # pylint: disable=broad-except
         ds_md = None
         md_len = 0
-        logging.debug(ex.message)
+        logging.debug(str(ex))
 
     if ds_md and md_len > 0 and "id" in ds_md[0]:
         return ds_md[0]["id"]
@@ -247,7 +261,7 @@ class ClipByShape(TerrarefExtractor):
             md_len = len(clowder_dataset.download_metadata(connector, host, key, dsid, extractor_name))
         except Exception as ex:     # pylint: disable=broad-except
             md_len = 0
-            logging.debug(ex.message)
+            logging.debug(str(ex))
 
         if md_len > 0:
             clowder_dataset.remove_metadata(connector, host, key, dsid, extractor_name)
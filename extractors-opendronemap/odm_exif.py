@@ -0,0 +1,126 @@
+"""Helper functions for finding the timestamps of drone images from their EXIF tags
+"""
+
+import sys
+import datetime
+import logging
+import piexif
+
+# EXIF tags to look for
+EXIF_ORIGIN_TIMESTAMP = 36867         # Capture timestamp
+EXIF_TIMESTAMP_OFFSET = 36881         # Timestamp UTC offset (general)
+EXIF_ORIGIN_TIMESTAMP_OFFSET = 36881  # Capture timestamp UTC offset
+
+# Number of bytes at the start of an image to look for EXIF tags in
+EXIF_READ_SIZE = 80 * 1024
+
+def load_exif_tags(image_path):
+    """Loads the EXIF tags from a JPEG image
+
+    Args:
+        image_path(str): the path of the image to load the tags from
+
+    Return:
+        The dictionary of tags returned by piexif
+
+    Notes:
+        The EXIF tags are near the start of the file, so we first try loading them from just
+        the start of the file. If that fails, the tags are loaded from the whole file
+    """
+    with open(image_path, 'rb') as in_file:
+        data = in_file.read(EXIF_READ_SIZE)
+
+    try:
+        return piexif.load(data)
+    except Exception:     # pylint: disable=broad-except
+        return piexif.load(image_path)
+
+def exif_tags_to_timestamp(exif_tags):
+    """Looks up the origin timestamp and a timestamp offset in the exit tags and returns
+       a datetime objext
+
+    Args:
+        exif_tags(dict): The exif tags to search for timestamp information
+
+    Return:
+        Returns the origin timestamp when found. The return timestamp is adjusted for UTF if
+        an offset is found. None is returned if a valid timestamp isn't found.
+    """
+    cur_stamp, cur_offset = (None, None)
+
+    def convert_and_clean_tag(value):
+        """Internal helper function for handling EXIF tag values. Tests for an empty string after
+           stripping colons, '+', '-', and whitespace [the spec is unclear if a +/- is needed when
+           the timestamp offset is unknown (and spaces are used)].
+        Args:
+            value(bytes or str): The tag value
+        Return:
+            Returns the cleaned up, and converted from bytes, string. Or None if the value is empty
+            after stripping above characters and whitespace.
+        """
+        if not value:
+            return None
+
+        # Convert bytes to string
+        if isinstance(value, bytes) and sys.version_info >= (3, 0):
+            value = value.decode('UTF-8').strip()
+        else:
+            value = value.strip()
+
+        # Check for an empty string after stripping colons
+        if value:
+            if not value.replace(":", "").replace("+:", "").replace("-", "").strip():
+                value = None
+
+        return None if not value else value
+
+    # Process the EXIF data
+    if EXIF_ORIGIN_TIMESTAMP in exif_tags:
+        cur_stamp = convert_and_clean_tag(exif_tags[EXIF_ORIGIN_TIMESTAMP])
+    if not cur_stamp:
+        return None
+
+    if EXIF_ORIGIN_TIMESTAMP_OFFSET in exif_tags:
+        cur_offset = convert_and_clean_tag(exif_tags[EXIF_ORIGIN_TIMESTAMP_OFFSET])
+    if not cur_offset and EXIF_TIMESTAMP_OFFSET in exif_tags:
+        cur_offset = convert_and_clean_tag(exif_tags[EXIF_TIMESTAMP_OFFSET])
+
+    # Format the string to a timestamp and return the result. The EXIF timestamp format is fixed
+    # ("YYYY:MM:DD HH:MM:SS" with an optional "+HH:MM" offset) so we pick out the fields directly
+    try:
+        if len(cur_stamp) != 19:
+            raise ValueError("Unexpected EXIF timestamp format: '%s'" % cur_stamp)
+        cur_ts = datetime.datetime(int(cur_stamp[0:4]), int(cur_stamp[5:7]), int(cur_stamp[8:10]),
+                                   int(cur_stamp[11:13]), int(cur_stamp[14:16]),
+                                   int(cur_stamp[17:19]))
+        if cur_offset:
+            cur_offset = cur_offset.replace(":", "")
+            if len(cur_offset) != 5 or cur_offset[0] not in "+-":
+                raise ValueError("Unexpected EXIF timestamp offset format: '%s'" % cur_offset)
+            offset_minutes = int(cur_offset[1:3]) * 60 + int(cur_offset[3:5])
+            if cur_offset[0] == "-":
+                offset_minutes = -offset_minutes
+            cur_ts = cur_ts.replace(tzinfo=datetime.timezone(datetime.timedelta(minutes=offset_minutes)))
+    except Exception as ex:     # pylint: disable=broad-except
+        cur_ts = None
+        logging.debug(str(ex))
+
+    return cur_ts
+
+def image_exif_timestamp(image_path):
+    """Returns the timestamp found in an image's EXIF tags
+
+    Args:
+        image_path(str): the path of the image
+
+    Return:
+        The timestamp returned by exif_tags_to_timestamp(), or None if the image doesn't have
+        EXIF tags or they couldn't be read
+    """
+    try:
+        tags_dict = load_exif_tags(image_path)
+        if tags_dict and "Exif" in tags_dict:
+            return exif_tags_to_timestamp(tags_dict["Exif"])
+    except Exception as ex:     # pylint: disable=broad-except
+        logging.debug("Unable to read EXIF timestamp from %s: %s", image_path, str(ex))
+    return None
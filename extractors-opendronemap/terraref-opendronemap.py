@@ -5,14 +5,33 @@
 
 import os
 import sys
+import atexit
+import errno
 import subprocess
 import tempfile
-import datetime
+import time
 import json
+import hashlib
 import gzip
 import shutil
+import signal
+import socket
 import logging
-import piexif
+from multiprocessing.pool import ThreadPool
+import requests
+
+# String types that may hold JSON, for both Python 2 and 3
+try:
+    JSON_STRING_TYPES = (basestring,)   # pylint: disable=undefined-variable
+except NameError:
+    JSON_STRING_TYPES = (str, bytes)
+
+try:
+    from shutil import which
+except ImportError:
+    from distutils.spawn import find_executable as which
+
+from osgeo import gdal
 
 import pyclowder.datasets as ds
 from pyclowder.files import upload_metadata
@@ -26,6 +45,8 @@ from opendm import config
 
 from opendrone_stitch import OpenDroneMapStitch
 
+from odm_exif import image_exif_timestamp
+
 # We need to add other sensor types for OpenDroneMap generated files before anything happens
 # The Sensor() class initialization defaults the sensor dictionary and we can't override
 # without many code changes
@@ -43,88 +64,189 @@ if 'ua-mac' in STATIONS:
                                      'pattern': '{sensor}_L2_{station}_{date}{opts}.shp'
                                     }
 
-# EXIF tags to look for
-EXIF_ORIGIN_TIMESTAMP = 36867         # Capture timestamp
-EXIF_TIMESTAMP_OFFSET = 36881         # Timestamp UTC offset (general)
-EXIF_ORIGIN_TIMESTAMP_OFFSET = 36881  # Capture timestamp UTC offset
+# Maximum number of images to look at when finding the earliest EXIF timestamp
+EXIF_SAMPLE_COUNT = 8
+
+# Filename/extension mappings for derived types that are not included in the
+# default RGB sensor mapping
+FILENAME_SENSOR_MAPS = {'.laz':'laz', '.shp':'shp', '.dbf':'shp', '.shx':'shp',
+                        'proj.txt':'shp', '.prj':'shp', '.json':'shp', '.geojson':'shp'}
+
+# Extensions of file formats that are already compressed and aren't worth compressing again
+COMPRESSED_EXTENSIONS = ('.laz', '.png', '.jpg', '.jpeg', '.zip', '.gz')
+
+# Compression level used when compressing files, and the size of the read buffer used when
+# compressing files in-process
+COMPRESS_LEVEL = 1
+COMPRESS_BUFFER_SIZE = 4 * 1024 * 1024
+
+# Default number of files to upload at the same time
+UPLOAD_WORKERS = 8
+
+# Number of times to try uploading a file, and the number of seconds to wait after the first
+# failure (the wait grows with each failure)
+UPLOAD_ATTEMPTS = 3
+UPLOAD_RETRY_DELAY = 2
+
+# HTTP status codes of upload failures that are worth retrying
+UPLOAD_RETRY_STATUS_CODES = (502, 503, 504)
+
+# Name of the folder, under the sensors base folder, that holds the per-message upload caches
+# and the ODM project folders
+CACHE_FOLDER_NAME = '.odm_cache'
+
+# Number of seconds after which a cache folder created on another host is considered abandoned
+CACHE_STALE_AGE = 7 * 24 * 60 * 60
+
+# Creation options for the GeoTIFF files we generate
+GTIFF_CREATE_OPTIONS = ['-co', 'COMPRESS=DEFLATE', '-co', 'NUM_THREADS=ALL_CPUS']
 
 # Deletes a folder tree and ensures the top level folder is deleted as well
 def check_delete_folder(folder):
     """Deletes a folder tree and ensures the top level folder is removes as well
     """
     if os.path.exists(folder):
-        try:
-            shutil.rmtree(folder)
-            # If the top level folder is still around, delete it explicitly
-            if os.path.exists(folder):
-                os.rmdir(folder)
-        # pylint: disable=broad-except
-        except Exception as ex:
-            logging.debug("Execption deleting folder %s", folder)
-            logging.debug("  %s", ex.message)
-
-def exif_tags_to_timestamp(exif_tags):
-    """Looks up the origin timestamp and a timestamp offset in the exit tags and returns
-       a datetime objext
+        # Large trees are removed much faster by rm than by removing each file from Python
+        rm_cmd = which('rm')
+        if not rm_cmd or subprocess.call([rm_cmd, '-rf', folder]) != 0:
+            shutil.rmtree(folder, ignore_errors=True)
+        if os.path.exists(folder):
+            logging.debug("Unable to completely delete folder %s", folder)
+
+def process_is_running(pid):
+    """Returns whether a process is running on this host
 
     Args:
-        exif_tags(dict): The exif tags to search for timestamp information
+        pid(int): the ID of the process to check
 
     Return:
-        Returns the origin timestamp when found. The return timestamp is adjusted for UTF if
-        an offset is found. None is returned if a valid timestamp isn't found.
+        Returns True if the process is running and False otherwise
     """
-    cur_stamp, cur_offset = (None, None)
+    try:
+        os.kill(pid, 0)
+    except OSError as ex:
+        return ex.errno == errno.EPERM
+    return True
 
-    def convert_and_clean_tag(value):
-        """Internal helper function for handling EXIF tag values. Tests for an empty string after
-           stripping colons, '+', '-', and whitespace [the spec is unclear if a +/- is needed when
-           the timestamp offset is unknown (and spaces are used)].
-        Args:
-            value(bytes or str): The tag value
-        Return:
-            Returns the cleaned up, and converted from bytes, string. Or None if the value is empty
-            after stripping above characters and whitespace.
-        """
-        if not value:
-            return None
+def folder_file_names(folder):
+    """Returns the names of the entries in a folder using a single directory read
 
-        # Convert bytes to string
-        if isinstance(value, bytes) and sys.version_info >= (3, 0):
-            value = value.decode('UTF-8').strip()
-        else:
-            value = value.strip()
+    Args:
+        folder(str): the path of the folder to list
+
+    Return:
+        A set of the names found in the folder. An empty set is returned if the folder
+        doesn't exist
+    """
+    scandir = getattr(os, 'scandir', None)
+    try:
+        if scandir:
+            return set(entry.name for entry in scandir(folder))
+        return set(os.listdir(folder))
+    except OSError:
+        return set()
 
-        # Check for an empty string after stripping colons
-        if value:
-            if not value.replace(":", "").replace("+:", "").replace("-", "").strip():
-                value = None
+def translate_image(dest_path, source_path, options):
+    """Converts an image using the GDAL library
 
-        return None if not value else value
+    Args:
+        dest_path(str): the path of the image to write
+        source_path(str): the path of the image to convert
+        options(list): the gdal_translate command line options to use
+
+    Return:
+        Returns True if the image was converted and False otherwise
+    """
+    # Depending on how GDAL is configured, a failure either returns None or raises an exception
+    try:
+        dataset = gdal.Translate(dest_path, source_path, options=options)
+        error_msg = gdal.GetLastErrorMsg()
+    except (RuntimeError, ValueError) as ex:
+        dataset = None
+        error_msg = str(ex)
+    succeeded = dataset is not None
+    if not succeeded:
+        logging.warning("Unable to convert %s to %s: %s", source_path, dest_path, error_msg)
+
+    # Closing the dataset makes sure it's written to disk
+    dataset = None
+    return succeeded
+
+def translate_images(conversions):
+    """Converts images at the same time and waits for all of them to finish
 
-    # Process the EXIF data
-    if EXIF_ORIGIN_TIMESTAMP in exif_tags:
-        cur_stamp = convert_and_clean_tag(exif_tags[EXIF_ORIGIN_TIMESTAMP])
-    if not cur_stamp:
-        return None
+    Args:
+        conversions(list): the conversions to run; each conversion is a tuple of the
+                           parameters to translate_image()
 
-    if EXIF_ORIGIN_TIMESTAMP_OFFSET in exif_tags:
-        cur_offset = convert_and_clean_tag(exif_tags[EXIF_ORIGIN_TIMESTAMP_OFFSET])
-    if not cur_offset and EXIF_TIMESTAMP_OFFSET in exif_tags:
-        cur_offset = convert_and_clean_tag(exif_tags[EXIF_TIMESTAMP_OFFSET])
+    Return:
+        A list of the results of translate_image() for each conversion
+    """
+    if not conversions:
+        return []
 
-    # Format the string to a timestamp and return the result
+    pool = ThreadPool(len(conversions))
     try:
-        if not cur_offset:
-            cur_ts = datetime.datetime.strptime(cur_stamp, "%Y:%m:%d %H:%M:%S")
-        else:
-            cur_offset = cur_offset.replace(":", "")
-            cur_ts = datetime.datetime.strptime(cur_stamp + cur_offset, "%Y:%m:%d %H:%M:%S%z")
-    except Exception as ex:     # pylint: disable=broad-except
-        cur_ts = None
-        logging.debug(ex.message)
+        return pool.map(lambda conversion: translate_image(*conversion), conversions)
+    finally:
+        pool.close()
+        pool.join()
+
+def move_file(source_path, dest_path):
+    """Moves a file, renaming it when possible
 
-    return cur_ts
+    Args:
+        source_path(str): the path of the file to move
+        dest_path(str): the path to move the file to
+
+    Notes:
+        The file contents are only copied when the destination is on a different device. The
+        source is only removed once the whole file has been copied
+    """
+    try:
+        getattr(os, 'replace', os.rename)(source_path, dest_path)
+    except OSError as ex:
+        if ex.errno != errno.EXDEV:
+            raise
+        shutil.copyfile(source_path, dest_path)
+        if os.path.getsize(dest_path) != os.path.getsize(source_path):
+            raise IOError("Incomplete copy of %s to %s" % (source_path, dest_path))
+        os.unlink(source_path)
+
+def is_transient_upload_error(ex):
+    """Returns whether an upload failure may succeed if it's tried again
+
+    Args:
+        ex(Exception): the exception raised by the upload
+
+    Return:
+        Returns True for connection errors, timeouts, and gateway or unavailable responses
+    """
+    if isinstance(ex, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    response = getattr(ex, 'response', None)
+    return isinstance(ex, requests.exceptions.HTTPError) and response is not None and \
+           response.status_code in UPLOAD_RETRY_STATUS_CODES
+
+def compress_file(source_path, dest_path):
+    """Compresses a file into gzip format
+
+    Args:
+        source_path(str): the path of the file to compress
+        dest_path(str): the path of the compressed file to write
+
+    Notes:
+        The pigz executable is used when it's available since it compresses using all
+        available processors. Otherwise the file is compressed in-process
+    """
+    pigz = which('pigz')
+    if pigz:
+        with open(dest_path, 'wb') as f_out:
+            subprocess.check_call([pigz, '-%d' % COMPRESS_LEVEL, '-c', source_path], stdout=f_out)
+    else:
+        with open(source_path, 'rb') as f_in:
+            with gzip.GzipFile(dest_path, mode='wb', compresslevel=COMPRESS_LEVEL) as f_out:
+                shutil.copyfileobj(f_in, f_out, COMPRESS_BUFFER_SIZE)
 
 # Class for performing a full field mosaic stitching using Clowder's opendronemap extractor
 # This class is mostly a wrapper around the OpenDroneMapStitch extractor
@@ -146,20 +268,67 @@ class ODMFullFieldStitcher(TerrarefExtractor, OpenDroneMapStitch):
         """
         super(ODMFullFieldStitcher, self).__init__()
 
-        # Array of files to upload once processing is done
+        # Our default values
+        upload_workers = int(os.getenv('UPLOAD_WORKERS', str(UPLOAD_WORKERS)))
+
+        # Add any additional arguments to parser
+        self.parser.add_argument('--upload-workers', type=int, dest='upload_workers',
+                                 default=upload_workers,
+                                 help='Number of files to upload to Clowder at the same time ' +
+                                 '(default=' + str(upload_workers) + ')')
+
+        # Array of files to upload once processing is done, and the same entries indexed by
+        # their lower case destination file names
         self.files_to_upload = None
+        self.upload_index = None
         self.sensor_maps = None
         self.sensor_dsid_map = None
         self.cache_folder = None
 
+        # Our working folders are named after our host and process so that other instances
+        # sharing the cache folder can tell whether we're still running
+        self.cache_root = None
+        self.cache_host_prefix = 'odm-' + socket.gethostname() + '-'
+        self.cache_prefix = self.cache_host_prefix + str(os.getpid()) + '-'
+
+        # Hashes of the extractor metadata we've put on datasets, indexed by dataset ID
+        self.dataset_metadata_hashes = {}
+
+        # Removes cache folders in the background so that we're not waiting on them between messages.
+        # Pending removals are finished on a normal exit or SIGTERM; anything a hard kill leaves
+        # behind is swept up when we next start
+        self.delete_pool = ThreadPool(1)
+        atexit.register(self.finish_deletes)
+
+        # Lookups of file extensions, and other file name endings, to sensor types
+        self.ext_sensor_map = {}
+        self.tail_sensor_map = {}
+        for ending, sensor in self.filename_sensor_maps.items():
+            if ending.startswith('.') and ending.count('.') == 1:
+                self.ext_sensor_map[ending] = sensor
+            else:
+                self.tail_sensor_map[ending] = sensor
+
+    def finish_deletes(self):
+        """Waits for any pending background folder removals to finish
+        """
+        self.delete_pool.close()
+        self.delete_pool.join()
+
     @property
     def filename_sensor_maps(self):
         """Returns array of file name endings and thier associated sensor types
         """
-        # Filename/extension mappings for derived types that are not included in the
-        # default RGB sensor mapping
-        return {'.laz':'laz', '.shp':'shp', '.dbf':'shp', '.shx':'shp',
-                'proj.txt':'shp', '.prj':'shp', '.json':'shp', '.geojson':'shp'}
+        return FILENAME_SENSOR_MAPS
+
+    def queue_upload(self, upload):
+        """Adds an entry to the list of files to upload
+
+        Args:
+            upload(dict): the upload entry to add
+        """
+        self.files_to_upload.append(upload)
+        self.upload_index.setdefault(upload["dest_name"].lower(), upload)
 
     @property
     def sensor_name(self):
@@ -177,7 +346,14 @@ class ODMFullFieldStitcher(TerrarefExtractor, OpenDroneMapStitch):
             dsid(str): the dataset to update
             metadata(str): the metadata string to update the dataset with
             extractor_name(str): the name of the extractor to associate the metadata with
+
+        Notes:
+            The dataset isn't updated if we've already put the same metadata on it
         """
+        md_hash = hashlib.md5((json.dumps(metadata, sort_keys=True) + extractor_name).encode('utf-8')).hexdigest()
+        if self.dataset_metadata_hashes.get(dsid) == md_hash:
+            return
+
         meta = build_metadata(host, self.extractor_info, dsid, metadata, "dataset")
 
         try:
@@ -185,12 +361,13 @@ class ODMFullFieldStitcher(TerrarefExtractor, OpenDroneMapStitch):
             md_len = len(md)
         except Exception as ex:     # pylint: disable=broad-except
             md_len = 0
-            logging.debug(ex.message)
+            logging.debug(str(ex))
 
         if md_len > 0:
             ds.remove_metadata(connector, host, key, dsid, extractor_name)
 
         ds.upload_metadata(connector, host, key, dsid, meta)
+        self.dataset_metadata_hashes[dsid] = md_hash
 
     # Called by OpenDroneMapStitch during the __init__ call
     # So we override it to make sure things happen the way we want them to
@@ -203,8 +380,45 @@ class ODMFullFieldStitcher(TerrarefExtractor, OpenDroneMapStitch):
         """
         # parse command line and load default logging configuration
         TerrarefExtractor.setup(self, sensor=self.sensor_name)
+
+        # Our working folders are kept on the same file system as the output folders so that
+        # files can be renamed into place instead of being copied
+        self.cache_root = os.path.join(self.sensors.base, CACHE_FOLDER_NAME)
+        if not os.path.exists(self.cache_root):
+            os.makedirs(self.cache_root)
+        self.sweep_cache_folders()
+
+        # Make sure the ODM project folder doesn't outlive us
+        odm_args.project_path = tempfile.mkdtemp(prefix=self.cache_prefix, dir=self.cache_root)
+        atexit.register(check_delete_folder, odm_args.project_path)
+
         OpenDroneMapStitch.dosetup(self, odm_args)
 
+    def sweep_cache_folders(self):
+        """Removes cache folders left behind by extractors that are no longer running
+
+        Notes:
+            Other extractor instances may be using the same cache folder. A folder created on this
+            host is removed when the process that created it isn't running, or has our process ID
+            since we haven't created any folders yet. Folders from other hosts are only removed
+            once they're older than CACHE_STALE_AGE
+        """
+        stale_time = time.time() - CACHE_STALE_AGE
+        for name in folder_file_names(self.cache_root):
+            path = os.path.join(self.cache_root, name)
+            try:
+                if name.startswith(self.cache_host_prefix):
+                    pid = name[len(self.cache_host_prefix):].split('-', 1)[0]
+                    stale = pid.isdigit() and (int(pid) == os.getpid() or \
+                                               not process_is_running(int(pid)))
+                else:
+                    stale = os.path.getmtime(path) < stale_time
+            except OSError:
+                continue
+            if stale:
+                logging.info("Removing abandoned cache folder %s", path)
+                check_delete_folder(path)
+
     def find_timestamp(self, resource, text):
         """Looks up a timestamp based upon EXIF data. Uses default mechanisms if a
            timestamp can't be found.
@@ -232,17 +446,25 @@ class ODMFullFieldStitcher(TerrarefExtractor, OpenDroneMapStitch):
                             if image['filename'].lower().endswith('.jpg'):
                                 paths.append(image['filename'])
 
-            # Find a timestamp to use by looking at EXIF data
-            for input_path in paths:
-                tags_dict = piexif.load(input_path)
-                if tags_dict and "Exif" in tags_dict:
-                    cur_stamp = exif_tags_to_timestamp(tags_dict["Exif"])
+            # Find a timestamp to use by looking at EXIF data. Drone image names are sequential
+            # so the earliest capture time is found in the first few images by name. The images
+            # are read at the same time
+            sample_paths = sorted(paths)[:EXIF_SAMPLE_COUNT]
+            if sample_paths:
+                pool = ThreadPool(len(sample_paths))
+                try:
+                    stamps = pool.map(image_exif_timestamp, sample_paths)
+                finally:
+                    pool.close()
+                    pool.join()
+
+                for cur_stamp in stamps:
                     if cur_stamp:
                         first_stamp = cur_stamp if first_stamp is None or cur_stamp < first_stamp \
                                                                                 else first_stamp
 
         except Exception as ex:     # pylint: disable=broad-except
-            logging.debug(ex.message)
+            logging.debug(str(ex))
 
         if first_stamp:
             return first_stamp.isoformat()
@@ -289,24 +511,29 @@ class ODMFullFieldStitcher(TerrarefExtractor, OpenDroneMapStitch):
             an alternate sensor, we map it to that new sensor type.
         """
 
-        # Make a copy of the file
         src_path = os.path.join(file_path, source_file_name)
         cache_path = os.path.join(self.cache_folder, source_file_name)
-        os.rename(src_path, cache_path)
+        source_ext = os.path.splitext(source_file_name)[1].lower()
+
+        # Don't compress files that are already compressed
+        if compress and source_ext in COMPRESSED_EXTENSIONS:
+            compress = False
 
         # Handle extensions/sensors
-        new_sensor = None
-        for m in self.filename_sensor_maps:
-            if source_file_name.endswith(m):
-                new_sensor = self.filename_sensor_maps[m]
-                break
+        new_sensor = self.ext_sensor_map.get(source_ext)
+        if not new_sensor:
+            for ending in self.tail_sensor_map:
+                if source_file_name.endswith(ending):
+                    new_sensor = self.tail_sensor_map[ending]
+                    break
 
         # Setup the correct path information based upon found sensor type
         if not new_sensor:
-            self.files_to_upload.append({"source_path":self.cache_folder,
-                                         "source_name":source_file_name,
-                                         "dest_path":self.cache_folder,
-                                         "dest_name":dest_file_name, "compress":compress})
+            move_file(src_path, cache_path)
+            self.queue_upload({"source_path":self.cache_folder,
+                               "source_name":source_file_name,
+                               "dest_path":self.cache_folder,
+                               "dest_name":dest_file_name, "compress":compress})
         elif new_sensor in self.sensor_maps:
             si = self.sensor_maps[new_sensor]
             # We need to keep the original filename extension but update the file name itself
@@ -316,14 +543,174 @@ class ODMFullFieldStitcher(TerrarefExtractor, OpenDroneMapStitch):
                 new_dest_file_name = si['name'].replace(src_ext, dest_ext)
             else:
                 new_dest_file_name = dest_file_name
-            self.files_to_upload.append({"source_path":self.cache_folder,
-                                         "source_name":source_file_name,
-                                         "dest_path":si["dir"], "dest_name":new_dest_file_name,
-                                         "compress":compress, "sensor":new_sensor})
+
+            # Files that don't need compressing are moved directly to where they will live so
+            # that we don't have to move them a second time when uploading
+            if compress:
+                move_file(src_path, cache_path)
+                self.queue_upload({"source_path":self.cache_folder,
+                                   "source_name":source_file_name,
+                                   "dest_path":si["dir"], "dest_name":new_dest_file_name,
+                                   "compress":compress, "sensor":new_sensor})
+            else:
+                if not os.path.exists(si["dir"]):
+                    os.makedirs(si["dir"])
+                move_file(src_path, os.path.join(si["dir"], new_dest_file_name))
+                self.queue_upload({"source_path":si["dir"],
+                                   "source_name":new_dest_file_name,
+                                   "dest_path":si["dir"], "dest_name":new_dest_file_name,
+                                   "compress":compress, "sensor":new_sensor})
         else:
             # Not found
             raise Exception("%s sensor path was not found" % new_sensor)
 
+    # Returns the Sensors instance for a sensor type
+    def get_sensor(self, sensor_type):
+        """Returns the Sensors instance for a sensor type in our station
+
+        Args:
+            sensor_type(str): the sensor to get the instance of
+
+        Return:
+            The Sensors instance
+        """
+        return Sensors(base=self.sensors.base, station=self.sensors.station, sensor=sensor_type)
+
+    # Finds or creates the dataset for a sensor
+    # pylint: disable=too-many-arguments
+    def get_sensor_dataset(self, connector, host, secret_key, sensor_type, season_name,
+                           experiment_name, timestamp, ds_exists):
+        """Returns the ID of the dataset for a sensor, creating the dataset if needed
+
+        Args:
+            connector(obj): the message queue connector instance
+            host(str): the URI of the host making the connection
+            secret_key(str): used with the host API
+            sensor_type(str): the sensor to get the dataset of
+            season_name(str): the name of the season
+            experiment_name(str): the name of the experiment
+            timestamp(str): the timestamp string associated with the source dataset
+            ds_exists(str): the ID of the existing dataset, or None if it doesn't exist yet
+
+        Return:
+            The ID of the dataset
+        """
+        if sensor_type in self.sensor_dsid_map:
+            return self.sensor_dsid_map[sensor_type]
+
+        new_sensor = self.get_sensor(sensor_type)
+
+        sensor_leaf_name = new_sensor.get_display_name() + ' - ' + timestamp
+        new_dsid = build_dataset_hierarchy_crawl(host, secret_key, self.clowder_user,
+                                                 self.clowder_pass, self.clowderspace,
+                                                 season_name, experiment_name,
+                                                 new_sensor.get_display_name(),
+                                                 timestamp[:4], timestamp[5:7], timestamp[8:10],
+                                                 leaf_ds_name=sensor_leaf_name)
+
+        if (self.overwrite_ok or not ds_exists) and self.experiment_metadata:
+            self.update_dataset_extractor_metadata(connector, host, secret_key, new_dsid,
+                                                   prepare_pipeline_metadata(self.experiment_metadata),
+                                                   self.extractor_info['name'])
+
+        self.sensor_dsid_map[sensor_type] = new_dsid
+        return new_dsid
+
+    # Gets a file ready for uploading
+    def prepare_upload(self, one_file, default_dsid):
+        """Compresses or moves a file on the upload list into place and determines its dataset
+
+        Args:
+            one_file(dict): the upload list entry to prepare
+            default_dsid(str): the default dataset to load files to
+
+        Return:
+            A tuple containing the path of the file to upload and the ID of the dataset to
+            upload it to
+        """
+        sourcefile = os.path.join(one_file["source_path"], one_file["source_name"])
+
+        # Make sure we have the original file and then compress it if needed, or remane is
+        if not os.path.isfile(sourcefile):
+            raise Exception("%s was not found" % sourcefile)
+
+        # make sure we have the full destination path
+        if not os.path.exists(one_file["dest_path"]):
+            os.makedirs(one_file["dest_path"])
+
+        resultfile = os.path.join(one_file["dest_path"], one_file["dest_name"])
+        if one_file["compress"]:
+            resultfile = resultfile + ".gz"
+            compress_file(sourcefile, resultfile)
+        elif not sourcefile == resultfile:
+            move_file(sourcefile, resultfile)
+
+        # Use the dataset of the sensor this entry belongs to, if it has one
+        cur_dataset_id = default_dsid
+        if "sensor" in one_file:
+            cur_dataset_id = self.sensor_dsid_map[one_file["sensor"]]
+
+        return (resultfile, cur_dataset_id)
+
+    # Uploads a file that's been prepared
+    # pylint: disable=too-many-arguments
+    def upload_prepared_file(self, connector, host, secret_key, resource, resultfile, dataset_id,
+                             content):
+        """Uploads a file, and its metadata, to a dataset
+
+        Args:
+            connector(obj): the message queue connector instance
+            host(str): the URI of the host making the connection
+            secret_key(str): used with the host API
+            resource(dict): dictionary containing the resources associated with the request
+            resultfile(str): the path of the file to upload
+            dataset_id(str): the ID of the dataset to upload the file to
+            content(str): content information for the file
+
+        Return:
+            The number of bytes uploaded, or None if the file was skipped
+
+        Notes:
+            This method is called from multiple threads at the same time
+        """
+        # Check if file already exists in the dataset. If we're overwriting files, any
+        # existing copy is deleted from the dataset as part of the same check
+        file_in_dataset = check_file_in_dataset(connector, host, secret_key, dataset_id,
+                                                resultfile, remove=self.overwrite_ok)
+
+        # If the files is already in the dataset, determine if we need to skip it
+        if self.overwrite_ok and file_in_dataset:
+            self.log_info(resource, "Removed existing file in dataset " + resultfile)
+        elif not self.overwrite_ok and file_in_dataset:
+            # We won't overwrite an existing file
+            self.log_skip(resource, "Not overwriting existing file in dataset " + resultfile)
+            return None
+
+        # Upload the file to the dataset. We try again when the host may only have been busy
+        for attempt in range(1, UPLOAD_ATTEMPTS + 1):
+            try:
+                # The host may have stored the file even though the last attempt failed. Since
+                # the file wasn't in the dataset before we started, any copy found is ours
+                if attempt > 1:
+                    check_file_in_dataset(connector, host, secret_key, dataset_id, resultfile,
+                                          remove=True)
+                fid = upload_to_dataset(connector, host, self.clowder_user, self.clowder_pass,
+                                        dataset_id, resultfile)
+                break
+            except requests.exceptions.RequestException as ex:
+                if attempt >= UPLOAD_ATTEMPTS or not is_transient_upload_error(ex):
+                    raise
+                logging.warning("Upload attempt %d of %s failed: %s", attempt, resultfile, str(ex))
+                time.sleep(UPLOAD_RETRY_DELAY * attempt)
+
+        # Generate our metadata
+        meta = build_metadata(host, self.extractor_info, fid, content, 'file')
+
+        # Upload the meadata to the dataset
+        upload_metadata(connector, host, secret_key, fid, meta)
+
+        return os.path.getsize(resultfile)
+
     # Performs the actual upload to the dataset
     # pylint: disable=line-too-long, too-many-locals
     def perform_uploads(self, connector, host, secret_key, resource, default_dsid, content, season_name, experiment_name, timestamp):
@@ -343,86 +730,44 @@ class ODMFullFieldStitcher(TerrarefExtractor, OpenDroneMapStitch):
             We loop through the files, compressing, and remapping the names as needed.
             If the sensor associated with the file is missing, we upload the file to
             the default dataset. Otherwise, we use the dataset associated with the sensor
-            and create the dataset if necessary
+            and create the dataset if necessary. All the sensor datasets are found or created
+            before any files are prepared. The datasets are looked up in parallel and created
+            one at a time, since they share parent collections. The uploads themselves are done
+            in parallel and the counts are updated once they are all done
         """
-        for one_file in self.files_to_upload:
-            sourcefile = os.path.join(one_file["source_path"], one_file["source_name"])
-
-            # Make sure we have the original file and then compress it if needed, or remane is
-            if os.path.isfile(sourcefile):
-                # make sure we have the full destination path
-                if not os.path.exists(one_file["dest_path"]):
-                    os.makedirs(one_file["dest_path"])
-
-                resultfile = os.path.join(one_file["dest_path"], one_file["dest_name"])
-                if one_file["compress"]:
-                    resultfile = resultfile + ".zip"
-                    with open(sourcefile, 'rb') as f_in:
-                        with gzip.open(resultfile, 'wb') as f_out:
-                            shutil.copyfileobj(f_in, f_out)
-                elif not sourcefile == resultfile:
-                    shutil.move(sourcefile, resultfile)
-
-                # Find or create the target dataset for this entry if it doesn't exist
-                cur_dataset_id = default_dsid
-                if "sensor" in one_file:
-                    sensor_type = one_file["sensor"]
-                    if sensor_type in self.sensor_dsid_map:
-                        cur_dataset_id = self.sensor_dsid_map[sensor_type]
-                    else:
-                        new_sensor = Sensors(base=self.sensors.base, station=self.sensors.station,
-                                             sensor=sensor_type)
-
-                        sensor_leaf_name = new_sensor.get_display_name() + ' - ' + timestamp
-                        ds_exists = get_datasetid_by_name(host, secret_key, sensor_leaf_name)
-                        new_dsid = build_dataset_hierarchy_crawl(host, secret_key,
-                                                                 self.clowder_user,
-                                                                 self.clowder_pass,
-                                                                 self.clowderspace,
-                                                                 season_name, experiment_name,
-                                                                 new_sensor.get_display_name(),
-                                                                 timestamp[:4], timestamp[5:7],
-                                                                 timestamp[8:10],
-                                                                 leaf_ds_name=sensor_leaf_name)
-
-                        if (self.overwrite_ok or not ds_exists) and self.experiment_metadata:
-                            self.update_dataset_extractor_metadata(connector, host, secret_key,
-                                                                   new_dsid,
-                                                                   prepare_pipeline_metadata(self.experiment_metadata),
-                                                                   self.extractor_info['name'])
-
-                        self.sensor_dsid_map[sensor_type] = new_dsid
-                        cur_dataset_id = new_dsid
-
-                # Check if file already exists in the dataset
-                file_in_dataset = check_file_in_dataset(connector, host, secret_key,
-                                                        cur_dataset_id, resultfile, remove=False)
-
-                # If the files is already in the dataset, determine if we need to delete it first
-                if self.overwrite_ok and file_in_dataset:
-                    # Delete the file from the dataset before uploading the new copy
-                    self.log_info(resource, "Removing existing file in dataset " + resultfile)
-                    check_file_in_dataset(connector, host, secret_key, cur_dataset_id,
-                                          resultfile, remove=True)
-                elif not self.overwrite_ok and file_in_dataset:
-                    # We won't overwrite an existing file
-                    self.log_skip(resource, "Not overwriting existing file in dataset " + resultfile)
-                    continue
-
-                # Upload the file to the dataset
-                fid = upload_to_dataset(connector, host, self.clowder_user, self.clowder_pass,
-                                        cur_dataset_id, resultfile)
-
-                # Generate our metadata
-                meta = build_metadata(host, self.extractor_info, fid, content, 'file')
-
-                # Upload the meadata to the dataset
-                upload_metadata(connector, host, secret_key, fid, meta)
+        upload_sensors = sorted(set(one_file["sensor"] for one_file in self.files_to_upload
+                                    if "sensor" in one_file) - set(self.sensor_dsid_map))
+        if upload_sensors:
+            leaf_names = [self.get_sensor(one_sensor).get_display_name() + ' - ' + timestamp
+                          for one_sensor in upload_sensors]
+            pool = ThreadPool(len(leaf_names))
+            try:
+                existing = pool.map(lambda name: get_datasetid_by_name(host, secret_key, name),
+                                    leaf_names)
+            finally:
+                pool.close()
+                pool.join()
+
+            for one_sensor, ds_exists in zip(upload_sensors, existing):
+                self.get_sensor_dataset(connector, host, secret_key, one_sensor, season_name,
+                                        experiment_name, timestamp, ds_exists)
+
+        prepared = [self.prepare_upload(one_file, default_dsid) for one_file in self.files_to_upload]
+
+        pool = ThreadPool(max(1, self.args.upload_workers))
+        try:
+            uploaded = pool.map(lambda upload: self.upload_prepared_file(connector, host, secret_key,
+                                                                         resource, upload[0],
+                                                                         upload[1], content),
+                                prepared)
+        finally:
+            pool.close()
+            pool.join()
 
+        for one_size in uploaded:
+            if one_size is not None:
                 self.created += 1
-                self.bytes += os.path.getsize(resultfile)
-            else:
-                raise Exception("%s was not found" % sourcefile)
+                self.bytes += one_size
 
     # We have a message to process
     # pylint: disable=too-many-branches, too-many-statements
@@ -442,17 +787,14 @@ class ODMFullFieldStitcher(TerrarefExtractor, OpenDroneMapStitch):
         TerrarefExtractor.process_message(self, connector, host, secret_key,
                                           resource, parameters)
 
-        # Handle any parameters
-        if isinstance(parameters, basestring):
+        # Handle any parameters, which may have been JSON encoded more than once
+        while isinstance(parameters, JSON_STRING_TYPES):
             parameters = json.loads(parameters)
-        if isinstance(parameters, unicode):
-            parameters = json.loads(str(parameters))
 
         # Array of files to upload once processing is done
         self.files_to_upload = []
-
-        # Our cache of files to upload
-        self.cache_folder = tempfile.mkdtemp()
+        self.upload_index = {}
+        self.cache_folder = None
 
         # We are only handling one sensor type here. ODM generates additional sensor outputs
         # that may not be available for upload; we handle those as we see them in upload_file()
@@ -471,8 +813,6 @@ class ODMFullFieldStitcher(TerrarefExtractor, OpenDroneMapStitch):
         try:
             # Get the best timestamp
             timestamp = timestamp_to_terraref(self.find_timestamp(resource, resource['dataset_info']['name']))
-            season_name, experiment_name, _ = self.get_season_and_experiment(timestamp,
-                                                                             self.sensor_name)
 
             # Generate the file names
             out_tif_full = self.sensors.get_sensor_path(timestamp,
@@ -482,32 +822,14 @@ class ODMFullFieldStitcher(TerrarefExtractor, OpenDroneMapStitch):
             out_png = out_tif_medium.replace(".tif", ".png")
             out_dir = os.path.dirname(out_tif_full)
 
-            # Generate dictionary of sensor output folders and file names
-            sensor_maps = {sensor_type: {"dir" : out_dir, "name" : os.path.basename(out_tif_full)}}
-            fsm = self.filename_sensor_maps
-            for one_map in fsm:
-                cur_sensor = fsm[one_map]
-                if not cur_sensor in sensor_maps:
-                    sensor_path = self.sensors.get_sensor_path(timestamp, sensor=cur_sensor,
-                                                               opts=[cur_sensor, scan_name]).replace(" ", "_")
-
-                    sensor_maps[cur_sensor] = {"dir" : os.path.dirname(sensor_path),
-                                               "name" : os.path.basename(sensor_path)
-                                              }
-            self.sensor_maps = sensor_maps
-
-            # Only generate what we need to by checking files on disk
-            thumb_exists, med_exists, full_exists, png_exists, only_png = \
-                                                                False, False, False, False, False
-
-            if file_exists(out_tif_thumb):
-                thumb_exists = True
-            if file_exists(out_tif_medium):
-                med_exists = True
-            if file_exists(out_tif_full):
-                full_exists = True
-            if file_exists(out_png):
-                png_exists = True
+            # Only generate what we need to by checking files on disk. We list the output folder
+            # once and only check the files that are there. This is done before any other setup
+            # so that we can return quickly when there's nothing to do
+            out_names = folder_file_names(out_dir)
+            thumb_exists, med_exists, full_exists, png_exists = \
+                        [os.path.basename(one_path) in out_names and file_exists(one_path)
+                         for one_path in (out_tif_thumb, out_tif_medium, out_tif_full, out_png)]
+            only_png = False
             if thumb_exists and med_exists and full_exists and not self.overwrite_ok:
                 if  png_exists:
                     self.log_skip(resource, "all outputs already exist")
@@ -517,7 +839,29 @@ class ODMFullFieldStitcher(TerrarefExtractor, OpenDroneMapStitch):
                                             " still be generated)")
                     only_png = True
 
+            # Our cache of files to upload. It's kept on the same file system as the output folders
+            # so that files can be renamed into place instead of being copied
+            if not os.path.exists(self.cache_root):
+                os.makedirs(self.cache_root)
+            self.cache_folder = tempfile.mkdtemp(prefix=self.cache_prefix, dir=self.cache_root)
+
+            season_name, experiment_name, _ = self.get_season_and_experiment(timestamp,
+                                                                             self.sensor_name)
+
+            # Generate dictionary of sensor output folders and file names
+            # Several file name endings map to the same sensor so we only look up each sensor once
+            sensor_maps = {sensor_type: {"dir" : out_dir, "name" : os.path.basename(out_tif_full)}}
+            for cur_sensor in set(FILENAME_SENSOR_MAPS.values()) - {sensor_type}:
+                sensor_path = self.sensors.get_sensor_path(timestamp, sensor=cur_sensor,
+                                                           opts=[cur_sensor, scan_name]).replace(" ", "_")
+
+                sensor_maps[cur_sensor] = {"dir" : os.path.dirname(sensor_path),
+                                           "name" : os.path.basename(sensor_path)
+                                          }
+            self.sensor_maps = sensor_maps
+
             # If we need the whole set of files, create them
+            conversions = []
             if not only_png:
                 # Override the output file name. We don't save anything here because we'll override
                 # it the next time through
@@ -528,34 +872,44 @@ class ODMFullFieldStitcher(TerrarefExtractor, OpenDroneMapStitch):
                                                    parameters)
 
                 # Look up the name of the full sized orthomosaic
-                basename = os.path.basename(out_tif_full)
                 srcname = None
-                for f in self.files_to_upload:
-                    if f["dest_name"] == basename:
-                        srcname = os.path.join(self.cache_folder, f["source_name"])
-                        break
-
-                # Generate other file sizes from the original orthomosaic
-                if srcname and not file_exists(out_tif_medium):
+                ortho_file = self.upload_index.get(os.path.basename(out_tif_full).lower())
+                if ortho_file:
+                    srcname = os.path.join(self.cache_folder, ortho_file["source_name"])
+
+                # Generate the medium sized image from the original orthomosaic. The thumbnail
+                # is made from the medium image when we have one since that's a fraction of the
+                # data to read (20% of the 10% image is 2% of the original)
+                thumb_src, thumb_pct = srcname, "2%"
+                if med_exists:
+                    thumb_src, thumb_pct = out_tif_medium, "20%"
+                elif srcname:
                     self.log_info(resource, "Converting orthomosaic to %s..." % out_tif_medium)
                     outname = os.path.join(self.cache_folder, os.path.basename(out_tif_medium))
-                    cmd = "gdal_translate -outsize %s%% %s%% %s %s" % (10, 10, srcname, outname)
-                    subprocess.call(cmd, shell=True)
+                    if translate_image(outname, srcname, ["-outsize", "10%", "10%"] +
+                                       GTIFF_CREATE_OPTIONS):
+                        thumb_src, thumb_pct = outname, "20%"
 
-                if srcname and not file_exists(out_tif_thumb):
+                if srcname and not thumb_exists:
                     self.log_info(resource, "Converting orthomosaic to %s..." % out_tif_thumb)
                     outname = os.path.join(self.cache_folder, os.path.basename(out_tif_thumb))
-                    cmd = "gdal_translate -outsize %s%% %s%% %s %s" % (2, 2, srcname, outname)
-                    subprocess.call(cmd, shell=True)
+                    conversions.append((outname, thumb_src, ["-outsize", thumb_pct, thumb_pct] +
+                                        GTIFF_CREATE_OPTIONS))
 
-            # We're here due to possibly needing the PNG Thumbnail
+            # We're here due to possibly needing the PNG Thumbnail. It's made from the medium image
+            # we just generated, or from the one we already have when we didn't generate it
             srcname = os.path.join(self.cache_folder, os.path.basename(out_tif_medium))
+            if med_exists and not os.path.exists(srcname):
+                srcname = out_tif_medium
             if (only_png or not png_exists) and file_exists(srcname):
                 # Create PNG thumbnail
                 self.log_info(resource, "Converting 10pct to %s..." % out_png)
                 outname = os.path.join(self.cache_folder, os.path.basename(out_png))
-                cmd = "gdal_translate -of PNG %s %s" % (srcname, outname)
-                subprocess.call(cmd, shell=True)
+                conversions.append((outname, srcname, ["-of", "PNG"]))
+
+            # The thumbnail and PNG conversions don't depend upon each other so we run them at
+            # the same time
+            translate_images(conversions)
 
             # Get dataset ID or create it, creating parent collections as needed
             leaf_ds_name = self.sensors.get_display_name() + ' - ' + timestamp
@@ -588,50 +942,38 @@ class ODMFullFieldStitcher(TerrarefExtractor, OpenDroneMapStitch):
             }
 
             # If we newly created these files, upload to Clowder
-            file_name = os.path.basename(out_tif_thumb)
-            file_path = os.path.join(self.cache_folder, file_name)
-            if file_exists(file_path) and not thumb_exists:
-                self.files_to_upload.append({"source_path":self.cache_folder,
-                                             "source_name":file_name, "dest_path":out_dir,
-                                             "dest_name":file_name, "compress":False})
-
-            file_name = os.path.basename(out_tif_medium)
-            file_path = os.path.join(self.cache_folder, file_name)
-            if file_exists(file_path) and not med_exists:
-                self.files_to_upload.append({"source_path":self.cache_folder,
-                                             "source_name":file_name, "dest_path":out_dir,
-                                             "dest_name":file_name, "compress":False})
-
-            file_name = os.path.basename(out_png)
-            file_path = os.path.join(self.cache_folder, file_name)
-            if file_exists(file_path) and not png_exists:
-                self.files_to_upload.append({"source_path":self.cache_folder,
-                                             "source_name":file_name, "dest_path":out_dir,
-                                             "dest_name":file_name, "compress":False})
+            cache_names = folder_file_names(self.cache_folder)
+            for out_path, out_exists in ((out_tif_thumb, thumb_exists), (out_tif_medium, med_exists),
+                                         (out_png, png_exists)):
+                file_name = os.path.basename(out_path)
+                if file_name in cache_names and not out_exists:
+                    self.queue_upload({"source_path":self.cache_folder,
+                                       "source_name":file_name, "dest_path":out_dir,
+                                       "dest_name":file_name, "compress":False})
 
             # The main orthomosaic is already getting uploaded, but we must make sure its path
             # is correct
-            srcname = os.path.basename(out_tif_full).lower()
-            for one_file in self.files_to_upload:
-                file_name = os.path.basename(one_file["dest_name"]).lower()
-                if file_name == srcname:
-                    one_file["dest_path"] = os.path.dirname(out_tif_full)
-                    break
+            one_file = self.upload_index.get(os.path.basename(out_tif_full).lower())
+            if one_file:
+                one_file["dest_path"] = os.path.dirname(out_tif_full)
 
             # This function uploads the files into their appropriate datasets
             self.perform_uploads(connector, host, secret_key, resource, target_dsid, content,
                                  season_name, experiment_name, timestamp)
 
-            # Cleanup the all destination folders skipping over ones that are in our "base" path
+            # Cleanup all destination folders, skipping over ones that are in our "base" path
             # (we want to keep those)
             base = self.sensors.base
-            if not self.cache_folder.startswith(base):
-                check_delete_folder(self.cache_folder)
-            for sp in self.sensor_maps:
-                if not self.sensor_maps[sp]["dir"].startswith(base):
-                    check_delete_folder(self.sensor_maps[sp]["dir"])
+            for sensor_info in self.sensor_maps.values():
+                if not sensor_info["dir"].startswith(base):
+                    check_delete_folder(sensor_info["dir"])
 
         finally:
+            # Our cache folder is removed no matter how processing ended. Each message has its
+            # own cache folder so it's safe to remove it in the background
+            if self.cache_folder:
+                self.delete_pool.apply_async(check_delete_folder, (self.cache_folder,))
+
             # We are done, restore fields we've modified (also be sure to restore fields in the
             # early returns in the code above)
             if restore_fn:
@@ -640,7 +982,10 @@ class ODMFullFieldStitcher(TerrarefExtractor, OpenDroneMapStitch):
 
 if __name__ == "__main__":
     args = config.config()
-    args.project_path = tempfile.mkdtemp()
+
+    # Exiting on SIGTERM lets the atexit handlers remove our working folders, which they
+    # otherwise wouldn't do when a container is stopped
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
 
     extractor = ODMFullFieldStitcher()
     extractor.dosetup(args)